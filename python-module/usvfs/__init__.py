@@ -4,14 +4,18 @@ Python bindings for the userspace virtual filesystem (usvfs) library.
 """
 
 
-from .usvfs_wrapper import USVFSException, VirtualFile, VirtualDirectory, Mapping, UserspaceVFS, dll
+from .usvfs_wrapper import USVFSException, USVFSWarning, VirtualFile, VirtualDirectory, Mapping, MappingStats, \
+    UserspaceVFS, DEFAULT_SHM_LIMIT, dll
 
 __all__ = (
     'dll',
     'USVFSException',
+    'USVFSWarning',
     'VirtualDirectory',
     'VirtualFile',
     'Mapping',
+    'MappingStats',
+    'DEFAULT_SHM_LIMIT',
     'UserspaceVFS'
 )
 
@@ -1,8 +1,22 @@
 
 import os.path
+import warnings
+from collections import Counter
 import usvfs._usvfs_dll as dll
 
 
+# Heuristic cost model for the usvfs redirection tree in shared memory: a fixed base, a per-node cost for the tree node,
+# its entry in the parent's child map and allocator bookkeeping, plus the bytes of node names and link targets. The
+# numbers are rough guesses, not derived from usvfs's actual node or allocator layout, so treat estimates based on them
+# as an order of magnitude.
+_SHM_BASE_BYTES = 64 * 1024
+_SHM_BYTES_PER_NODE = 192
+
+# Heuristic threshold for the estimated footprint above which set_mapping() warns before applying a mapping. This is
+# not a limit enforced by usvfs.
+DEFAULT_SHM_LIMIT = 64 * 1024 * 1024
+
+
 class USVFSException(Exception):
     """
     Generic exception for errors related to the usvfs library.
@@ -11,6 +25,14 @@ class USVFSException(Exception):
     pass
 
 
+class USVFSWarning(UserWarning):
+    """
+    Warning for conditions that are likely, but not certain, to cause problems in the usvfs library.
+    """
+
+    pass
+
+
 class _VirtualLink:
     """
     Base class for virtual link rules.
@@ -246,6 +268,98 @@ class VirtualDirectory(_VirtualLink):
             self.link_flags &= ~dll.LINKFLAG_MONITORCHANGES  # Unset flag
 
 
+class MappingStats:
+    """
+    Capacity report for a Mapping, as returned by Mapping.stats().
+
+    All figures are computed in Python; the usvfs dll is not involved. The shared-memory footprint is a heuristic
+    estimate of the size of the redirection tree usvfs builds when the mapping is applied.
+
+    :ivar rules_by_kind: number of rules per kind ('directory', 'file')
+    :vartype rules_by_kind: dict[str, int]
+
+    :ivar rules_by_flag: number of rules that have each link flag set, keyed by flag name (e.g. 'LINKFLAG_RECURSIVE')
+    :vartype rules_by_flag: dict[str, int]
+
+    :ivar duplicate_rules: number of rules with a virtual path that an earlier rule already targets
+    :vartype duplicate_rules: int
+
+    :ivar node_count: number of nodes in the virtual tree, including the root and all intermediate directories
+    :vartype node_count: int
+
+    :ivar depth_histogram: number of nodes per depth (the root has depth 0)
+    :vartype depth_histogram: dict[int, int]
+
+    :ivar fanout_histogram: number of non-leaf nodes per child count
+    :vartype fanout_histogram: dict[int, int]
+
+    :ivar estimated_shm_bytes: estimated shared-memory footprint of the redirection tree in bytes
+    :vartype estimated_shm_bytes: int
+
+    :ivar shm_limit: footprint in bytes above which the mapping is considered too large, or None for no limit
+    :vartype shm_limit: Optional[int]
+    """
+
+    def __init__(self, rules_by_kind, rules_by_flag, duplicate_rules, node_count, depth_histogram, fanout_histogram,
+                 estimated_shm_bytes, shm_limit):
+        self.rules_by_kind = rules_by_kind
+        self.rules_by_flag = rules_by_flag
+        self.duplicate_rules = duplicate_rules
+        self.node_count = node_count
+        self.depth_histogram = depth_histogram
+        self.fanout_histogram = fanout_histogram
+        self.estimated_shm_bytes = estimated_shm_bytes
+        self.shm_limit = shm_limit
+
+    def __str__(self):
+        lines = [
+            'Rules: {} ({} directories, {} files, {} duplicates)'.format(
+                self.rule_count, self.rules_by_kind['directory'], self.rules_by_kind['file'], self.duplicate_rules),
+            'Flags: {}'.format(', '.join('{}={}'.format(k, v) for k, v in sorted(self.rules_by_flag.items()))),
+            'Nodes: {} (max depth {}, max fan-out {})'.format(
+                self.node_count, self.max_depth, max(self.fanout_histogram, default=0)),
+            'Estimated shared memory: {:.1f} MiB'.format(self.estimated_shm_bytes / 2 ** 20)
+        ]
+
+        if self.shm_limit is not None:
+            lines[-1] += ' of {:.1f} MiB limit'.format(self.shm_limit / 2 ** 20)
+
+        return '\n'.join(lines)
+
+    @property
+    def rule_count(self):
+        """
+        Total number of link rules in the mapping.
+
+        :return: number of rules
+        :rtype: int
+        """
+
+        return sum(self.rules_by_kind.values())
+
+    @property
+    def max_depth(self):
+        """
+        Depth of the deepest node in the virtual tree.
+
+        :return: maximum node depth
+        :rtype: int
+        """
+
+        return max(self.depth_histogram, default=0)
+
+    @property
+    def exceeds_limit(self):
+        """
+        Indicates whether the estimated shared-memory footprint exceeds shm_limit. Always False if shm_limit is None.
+
+        :return: bool indicating whether the mapping is likely too large to apply
+        :rtype: bool
+        """
+
+        return self.shm_limit is not None and self.estimated_shm_bytes > self.shm_limit
+
+
 class Mapping:
     """
     Class that represents a collection of virtual link rules.
@@ -291,6 +405,112 @@ class Mapping:
         for f in self._files:
             yield f
 
+    def stats(self, shm_limit=DEFAULT_SHM_LIMIT, expand_directories=False):
+        """
+        Compute a capacity report for this mapping without applying it.
+
+        usvfs stores its redirection tree in a shared-memory segment. Very large mappings are slow to apply and can
+        exhaust that segment, which otherwise only shows when set_mapping() fails. Use this to check a mapping, and
+        split or trim it, beforehand.
+
+        The computation is plain Python. Without expand_directories, 1M file rules took 0.73 to 1.05 seconds in
+        testing, so a one-second budget is usually but not always met. Most of that time goes into case-folding,
+        hashing and splitting every virtual path, which each rule needs at least once.
+
+        :param shm_limit: footprint in bytes above which the mapping is considered too large, or None for no limit
+        (optional, default=DEFAULT_SHM_LIMIT)
+        :type shm_limit: Optional[int]
+
+        :param expand_directories: whether to scan the real directories of directory links on disk and include their
+        contents in the virtual tree, like usvfs does when the mapping is applied. If False, only the virtual paths of
+        the rules themselves are counted (optional, default=False)
+        :type expand_directories: bool
+
+        :return: capacity report for this mapping
+        :rtype: MappingStats
+        """
+
+        flag_names = ('LINKFLAG_FAILIFEXISTS', 'LINKFLAG_MONITORCHANGES', 'LINKFLAG_CREATETARGET',
+                      'LINKFLAG_RECURSIVE')
+        rules = self._dirs + self._files
+        flags_seen = Counter(link.link_flags for link in rules)
+        sep = os.sep
+
+        # Virtual paths of all link rules, case-folded. They are already normalised by os.path.abspath(), so the root of
+        # the tree is the empty path above the drive ('c:') or the leading separator. Plain list comprehensions and a
+        # set are used rather than a single explicit loop over the rules, because they are considerably faster for
+        # large mappings.
+        keys = [link.virtual_path.lower() for link in rules]
+        targets = set(keys)
+        duplicate_rules = len(keys) - len(targets)
+
+        if duplicate_rules:
+            # A later rule for the same virtual path replaces an earlier one
+            unique = dict(zip(keys, [link.real_path for link in rules]))
+            keys = list(unique)
+            target_bytes = sum(map(len, unique.values()))
+        else:
+            target_bytes = sum(len(link.real_path) for link in rules)
+
+        if expand_directories:
+            for link in self._dirs:
+                key = link.virtual_path.lower().rstrip(sep)
+
+                for root, dirnames, filenames in os.walk(link.real_path):
+                    rel = os.path.relpath(root, link.real_path)
+                    vroot = key if rel == os.curdir else key + sep + rel.lower()
+
+                    for name in dirnames + filenames:
+                        child = vroot + sep + name.lower()
+
+                        if child not in targets:
+                            targets.add(child)
+                            keys.append(child)
+                            target_bytes += len(root) + len(name) + 1
+
+                    if not link.link_flags & dll.LINKFLAG_RECURSIVE:
+                        break
+
+        # Build the virtual tree one level at a time: add the parents of all nodes added in the previous pass, until
+        # we reach the root. Each node's parent is computed exactly once, which gives us the child counts. Nodes are
+        # processed as lists in insertion order, which is a lot faster for large trees than iterating in hash order.
+        interior = {''}
+        frontier = keys
+        child_counts = Counter()
+        name_bytes = 0
+
+        while frontier:
+            level = Counter([key.rpartition(sep)[0] for key in frontier])
+            child_counts.update(level)
+            name_bytes += sum(map(len, frontier)) - sum((len(parent) + 1) * n for parent, n in level.items())
+            frontier = [key for key in level if key not in interior and key not in targets]
+            interior.update(frontier)
+
+        # Every node except the root is a child of exactly one parent, one level deeper than that parent. This gives
+        # the depth histogram from the (usually few) parent nodes alone.
+        depth_histogram = Counter({0: 1})
+        for parent, n in child_counts.items():
+            # Posix paths have a separator before their first component, Windows paths do not
+            depth = parent.count(sep) + (not parent.startswith(sep)) if parent else 0
+            depth_histogram[depth + 1] += n
+
+        node_count = len(targets) + len(interior)
+        fanout_histogram = Counter(child_counts.values())
+
+        estimated_shm_bytes = _SHM_BASE_BYTES + node_count * _SHM_BYTES_PER_NODE + name_bytes + target_bytes
+
+        return MappingStats(
+            rules_by_kind={'directory': len(self._dirs), 'file': len(self._files)},
+            rules_by_flag={name: sum(n for flags, n in flags_seen.items() if flags & getattr(dll, name))
+                           for name in flag_names},
+            duplicate_rules=duplicate_rules,
+            node_count=node_count,
+            depth_histogram=dict(sorted(depth_histogram.items())),
+            fanout_histogram=dict(sorted(fanout_histogram.items())),
+            estimated_shm_bytes=estimated_shm_bytes,
+            shm_limit=shm_limit
+        )
+
 
 class UserspaceVFS:
     """
@@ -396,13 +616,30 @@ class UserspaceVFS:
 
         return dll.GetCurrentVFSName().startswith(self.instance_name)
 
-    def set_mapping(self, mapping):
+    def set_mapping(self, mapping, shm_limit=DEFAULT_SHM_LIMIT, expand_directories=False):
         """
         Apply a virtual link mapping to the vfs.
 
+        Before applying, the shared-memory footprint of the mapping is estimated using Mapping.stats(). If it exceeds
+        shm_limit, a USVFSWarning is issued; the mapping is applied regardless. Both the estimate and the default limit
+        are heuristics, not figures taken from usvfs.
+
+        By default the estimate counts each directory link as a single node, so the files usvfs adds for a linked
+        directory are not included. Set expand_directories to True to include them; this walks those directories on
+        disk before usvfs walks them again to apply the mapping. To check a mapping with large directory links without
+        applying it, use Mapping.stats(expand_directories=True).
+
         :param mapping: a Mapping object specifying the virtual link mapping
         :type mapping: Mapping
 
+        :param shm_limit: estimated footprint in bytes above which to warn, or None to skip the check
+        (optional, default=DEFAULT_SHM_LIMIT)
+        :type shm_limit: Optional[int]
+
+        :param expand_directories: whether the estimate includes the contents of linked directories
+        (optional, default=False)
+        :type expand_directories: bool
+
         :raises USVFSException: if vfs is not initialized
         """
 
@@ -412,6 +649,14 @@ class UserspaceVFS:
         if not self._initialized:
             raise USVFSException('VFS is not initialized')
 
+        if shm_limit is not None:
+            stats = mapping.stats(shm_limit=shm_limit, expand_directories=expand_directories)
+
+            if stats.exceeds_limit:
+                warnings.warn('Mapping is estimated to need {} bytes of shared memory, which exceeds the limit of {} '
+                              'bytes. Consider splitting the mapping or linking fewer files.'
+                              .format(stats.estimated_shm_bytes, shm_limit), USVFSWarning, stacklevel=2)
+
         self._ensure_active_instance()
 
         # Clear any existing mappings